@@ -1,14 +1,29 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import os
 import shutil
+import asyncio
+import gzip
+import hashlib
+import json
+import mimetypes
+import random
+import re
+import tarfile
+import time
+import threading
+import uuid
 from pathlib import Path
 import cv2
 import numpy as np
-from datetime import datetime
+from datetime import datetime, timedelta
+
+try:
+    import brotli
+except ImportError:
+    brotli = None  # Alleen gzip varianten als brotli niet geïnstalleerd is
 
 app = FastAPI()
 
@@ -31,10 +46,307 @@ REFERENCE_IMAGE = Path(".") / "orgineel.JPG"
 # Global threshold - kan worden aangepast via admin interface
 MATCH_THRESHOLD = 0.80  # Default 80%
 
+MATCH_MESSAGE = "Gefeliciteerd, je hebt de puzzel opgelost, de code is: 196"
+NO_MATCH_MESSAGE = "Helaas, de puzzel is nog niet goed opgelost, probeer het nogmaals en upload een nieuwe foto"
+
+# Upload opslag: uploads/YYYY/MM/DD/<hash prefix>/<upload_id>.<ext> + index.jsonl
+UPLOAD_INDEX_FILE = UPLOAD_DIR / "index.jsonl"
+UPLOAD_ARCHIVE_DIR = UPLOAD_DIR / "archive"
+
+# Retentie: uploads ouder dan UPLOAD_RETENTION_DAYS worden gearchiveerd of verwijderd
+UPLOAD_RETENTION_DAYS = float(os.getenv("UPLOAD_RETENTION_DAYS", "7"))
+UPLOAD_RETENTION_POLICY = os.getenv("UPLOAD_RETENTION_POLICY", "archive").lower()  # "archive" of "delete"
+if UPLOAD_RETENTION_POLICY not in ("archive", "delete"):
+    raise ValueError(
+        f"Invalid UPLOAD_RETENTION_POLICY {UPLOAD_RETENTION_POLICY!r}: must be 'archive' or 'delete'"
+    )
+UPLOAD_RETENTION_INTERVAL = int(os.getenv("UPLOAD_RETENTION_INTERVAL", "3600"))  # seconden
+
+# Prefilter: goedkope globale signature om duidelijke non-matches over te slaan
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "true").lower() == "true"
+PREFILTER_MIN_HIST_CORREL = float(os.getenv("PREFILTER_MIN_HIST_CORREL", "0.2"))
+PREFILTER_MAX_HASH_DISTANCE = int(os.getenv("PREFILTER_MAX_HASH_DISTANCE", "24"))  # van 64 bits
+# Histogram ver onder deze grens: afwijzen tenzij de hash dichtbij is (bijv. andere witbalans)
+PREFILTER_HARD_MIN_HIST_CORREL = float(os.getenv("PREFILTER_HARD_MIN_HIST_CORREL", "0.05"))
+# Egale of wazige foto's: afwijzen onder deze textuur (Laplacian variantie op 256 px)
+PREFILTER_MIN_TEXTURE = float(os.getenv("PREFILTER_MIN_TEXTURE", "30"))
+# Fractie van afgewezen uploads die toch de volledige vergelijking draait (meet false-rejects)
+PREFILTER_SHADOW_RATE = float(os.getenv("PREFILTER_SHADOW_RATE", "0.1"))
+
+# Static assets van de React build: bij startup geïndexeerd en gecomprimeerd
+BUILD_DIR = Path(".") / "build"
+STATIC_MEMORY_MAX_BYTES = int(os.getenv("STATIC_MEMORY_MAX_BYTES", str(512 * 1024)))
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json",
+                      "application/manifest+json", "image/svg+xml")
+# CRA bestanden met content hash in de naam, bijv. main.3f2a1b9c.js
+HASHED_FILENAME = re.compile(r"\.[0-9a-f]{8,}\.")
+
+# Live camera matching: SIFT op keyframes, optical flow daartussen
+LIVE_FRAME_MAX_SIZE = int(os.getenv("LIVE_FRAME_MAX_SIZE", "480"))  # pixels, langste zijde
+LIVE_KEYFRAME_INTERVAL = int(os.getenv("LIVE_KEYFRAME_INTERVAL", "15"))  # frames tussen keyframes bij tracking
+LIVE_RETRY_INTERVAL = int(os.getenv("LIVE_RETRY_INTERVAL", "5"))  # frames tussen keyframes zonder lock
+LIVE_MIN_TRACKED_POINTS = int(os.getenv("LIVE_MIN_TRACKED_POINTS", "12"))
+
+NO_CACHE_HEADERS = {
+    "Cache-Control": "no-cache, no-store, must-revalidate",
+    "Pragma": "no-cache",
+    "Expires": "0"
+}
+
 # Pydantic models voor API requests
 class ThresholdUpdate(BaseModel):
     threshold: float
 
+# In-memory kopie van de upload index (upload_id -> entry), in upload volgorde
+_upload_index = {}
+_upload_index_lock = threading.Lock()
+
+def _load_upload_index():
+    """Laad de upload index van disk (één JSON object per regel)."""
+    _upload_index.clear()
+    if not UPLOAD_INDEX_FILE.exists():
+        return
+    with open(UPLOAD_INDEX_FILE, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Half geschreven regel na een crash: overslaan
+                continue
+            _upload_index[entry["id"]] = entry
+
+def _rewrite_upload_index():
+    """Schrijf de volledige index atomair opnieuw weg (aanroepen met lock)."""
+    tmp_path = UPLOAD_INDEX_FILE.with_suffix(".jsonl.tmp")
+    with open(tmp_path, "w") as f:
+        for entry in _upload_index.values():
+            f.write(json.dumps(entry) + "\n")
+    os.replace(tmp_path, UPLOAD_INDEX_FILE)
+
+def _shard_dir(created: datetime, digest: str) -> Path:
+    """Shard directory voor een upload: YYYY/MM/DD/<eerste 2 hex tekens van de hash>."""
+    return UPLOAD_DIR / created.strftime("%Y") / created.strftime("%m") / created.strftime("%d") / digest[:2]
+
+def store_upload(content: bytes, file_extension: str) -> dict:
+    """
+    Sla een upload op in een gesharde directory en voeg hem toe aan de index.
+
+    Het upload ID bevat naast de timestamp een random suffix, zodat twee uploads
+    in dezelfde seconde nooit dezelfde bestandsnaam krijgen.
+    """
+    now = datetime.now()
+    upload_id = f"upload_{now.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    digest = hashlib.sha256(content).hexdigest()
+
+    shard_dir = _shard_dir(now, digest)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    file_path = shard_dir / f"{upload_id}{file_extension}"
+
+    # "xb": faalt in plaats van een bestaand bestand te overschrijven
+    with open(file_path, "xb") as buffer:
+        buffer.write(content)
+
+    entry = {
+        "id": upload_id,
+        "filename": file_path.name,
+        "path": str(file_path.relative_to(UPLOAD_DIR)),
+        "created": now.isoformat(timespec="seconds"),
+        "size": len(content),
+        "sha256": digest,
+    }
+
+    with _upload_index_lock:
+        with open(UPLOAD_INDEX_FILE, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        _upload_index[upload_id] = entry
+
+    return entry
+
+def update_upload(upload_id: str, **fields):
+    """Voeg velden (bijv. match resultaat) toe aan een bestaande index entry."""
+    with _upload_index_lock:
+        entry = _upload_index.get(upload_id)
+        if entry is None:
+            return
+        entry.update(fields)
+        with open(UPLOAD_INDEX_FILE, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+def migrate_flat_uploads():
+    """
+    Eenmalige migratie van oude platte uploads (uploads/upload_YYYYMMDD_HHMMSS.ext)
+    naar shard directories, met mtime als aanmaaktijd.
+
+    De index entry wordt eerst geschreven en daarna wordt het bestand verplaatst;
+    na een crash pakt de volgende startup het bestand gewoon opnieuw op.
+    """
+    flat_files = [
+        f for f in UPLOAD_DIR.iterdir()
+        if f.is_file() and f.name.startswith("upload_") and not f.name.startswith("upload_latest")
+    ]
+    if not flat_files:
+        return
+
+    for file_path in sorted(flat_files, key=lambda f: f.stat().st_mtime):
+        upload_id = file_path.stem
+
+        with _upload_index_lock:
+            entry = _upload_index.get(upload_id)
+
+        if entry is None:
+            content = file_path.read_bytes()
+            created = datetime.fromtimestamp(file_path.stat().st_mtime)
+            digest = hashlib.sha256(content).hexdigest()
+            target = _shard_dir(created, digest) / file_path.name
+            entry = {
+                "id": upload_id,
+                "filename": file_path.name,
+                "path": str(target.relative_to(UPLOAD_DIR)),
+                "created": created.isoformat(timespec="seconds"),
+                "size": len(content),
+                "sha256": digest,
+            }
+            with _upload_index_lock:
+                with open(UPLOAD_INDEX_FILE, "a") as f:
+                    f.write(json.dumps(entry) + "\n")
+                _upload_index[upload_id] = entry
+
+        if "path" not in entry:
+            continue
+
+        target = UPLOAD_DIR / entry["path"]
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(file_path, target)
+
+    print(f"📁 Migrated {len(flat_files)} flat uploads to shard directories")
+
+def latest_upload():
+    """Retourneer de index entry van de meest recente upload (of None)."""
+    with _upload_index_lock:
+        if not _upload_index:
+            return None
+        return next(reversed(_upload_index.values()))
+
+def read_upload(entry: dict) -> bytes:
+    """Lees een upload, uit de hot directory of via offset uit een archief segment."""
+    if "path" in entry:
+        with open(UPLOAD_DIR / entry["path"], "rb") as f:
+            return f.read()
+
+    with open(UPLOAD_DIR / entry["archive"], "rb") as f:
+        f.seek(entry["offset"])
+        return f.read(entry["size"])
+
+def _remove_empty_shard_dirs(file_path: Path):
+    """Ruim lege shard directories op tot aan UPLOAD_DIR."""
+    parent = file_path.parent
+    while parent != UPLOAD_DIR and UPLOAD_DIR in parent.parents:
+        try:
+            parent.rmdir()
+        except OSError:
+            break
+        parent = parent.parent
+
+def compact_uploads(now: datetime = None) -> dict:
+    """
+    Retentie job: verplaats uploads ouder dan UPLOAD_RETENTION_DAYS uit de hot directory.
+
+    Policy "archive": per dag worden uploads toegevoegd aan een tar segment
+    (archive/uploads_YYYYMMDD.tar). De index bewaart per upload de offset en grootte
+    van de data in het segment, zodat een upload direct uitgelezen kan worden.
+    Policy "delete": oude uploads (en hun index entries) worden verwijderd.
+    """
+    now = now or datetime.now()
+    cutoff = (now - timedelta(days=UPLOAD_RETENTION_DAYS)).isoformat(timespec="seconds")
+
+    # Snapshot onder lock; de file I/O zelf gebeurt zonder lock zodat uploads doorlopen
+    with _upload_index_lock:
+        expired = [dict(e) for e in _upload_index.values() if "path" in e and e["created"] < cutoff]
+
+    if not expired:
+        return {"archived": 0, "deleted": 0, "missing": 0}
+
+    # Bestanden die al weg zijn (crash, handmatig verwijderd) alleen uit de index halen
+    missing = [e for e in expired if not (UPLOAD_DIR / e["path"]).is_file()]
+    for entry in missing:
+        print(f"⚠️  Retention: {entry['path']} missing, removing from index")
+    expired = [e for e in expired if (UPLOAD_DIR / e["path"]).is_file()]
+
+    updates = {}
+    deleted = []
+
+    if UPLOAD_RETENTION_POLICY == "delete":
+        deleted = [entry["id"] for entry in expired]
+    else:
+        UPLOAD_ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+
+        segments = {}
+        for entry in expired:
+            day = entry["created"][:10].replace("-", "")
+            segments.setdefault(day, []).append(entry)
+
+        for day, entries in segments.items():
+            segment_path = UPLOAD_ARCHIVE_DIR / f"uploads_{day}.tar"
+
+            with tarfile.open(segment_path, "a") as tar:
+                for entry in entries:
+                    tar.add(UPLOAD_DIR / entry["path"], arcname=entry["filename"])
+
+            # Offsets uitlezen uit de tar headers (bij dubbele namen telt de laatste)
+            with tarfile.open(segment_path, "r") as tar:
+                offsets = {m.name: (m.offset_data, m.size) for m in tar.getmembers()}
+
+            for entry in entries:
+                offset, size = offsets[entry["filename"]]
+                updates[entry["id"]] = {
+                    "archive": str(segment_path.relative_to(UPLOAD_DIR)),
+                    "offset": offset,
+                    "size": size,
+                }
+
+    # Eerst de index committen, pas daarna de hot bestanden verwijderen
+    with _upload_index_lock:
+        for upload_id in deleted + [e["id"] for e in missing]:
+            _upload_index.pop(upload_id, None)
+        for upload_id, fields in updates.items():
+            entry = _upload_index.get(upload_id)
+            if entry is not None:
+                entry.pop("path", None)
+                entry.update(fields)
+        _rewrite_upload_index()
+
+    for entry in expired + missing:
+        file_path = UPLOAD_DIR / entry["path"]
+        file_path.unlink(missing_ok=True)
+        _remove_empty_shard_dirs(file_path)
+
+    print(f"🗄️  Retention: {len(updates)} uploads archived, {len(deleted)} deleted, {len(missing)} missing")
+
+    return {"archived": len(updates), "deleted": len(deleted), "missing": len(missing)}
+
+async def retention_loop():
+    """Achtergrond taak die periodiek compact_uploads draait buiten de event loop."""
+    while True:
+        await asyncio.sleep(UPLOAD_RETENTION_INTERVAL)
+        try:
+            await asyncio.to_thread(compact_uploads)
+        except Exception as e:
+            print(f"⚠️  Retention job failed: {e}")
+
+_load_upload_index()
+migrate_flat_uploads()
+
+# Referentie naar de retentie taak, zodat die niet door de garbage collector verdwijnt
+_retention_task = None
+
+@app.on_event("startup")
+async def start_retention_job():
+    global _retention_task
+    _retention_task = asyncio.create_task(retention_loop())
+
 def preprocess_image(img):
     """
     Pre-process afbeelding om robuust te zijn tegen lichtreflecties en verschillende belichting.
@@ -54,6 +366,14 @@ def preprocess_image(img):
 
     return processed
 
+def resize_max(img, max_size):
+    """Verklein afbeelding zodat de langste zijde max_size is (behoud aspect ratio)."""
+    h, w = img.shape[:2]
+    scale = max_size / max(h, w)
+    if scale >= 1:
+        return img
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
 def rotate_image(img, angle):
     """Roteer afbeelding 0, 90, 180, of 270 graden."""
     if angle == 0:
@@ -160,6 +480,149 @@ def compare_with_rotation(img_ref, img_test):
 
     return best_inliers, best_total_matches, best_rotation, best_homography, best_warped
 
+def dhash(gray, hash_size=8):
+    """Difference hash: 64-bit perceptuele hash van een grayscale afbeelding."""
+    resized = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (resized[:, 1:] > resized[:, :-1]).flatten()
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+def compute_signature(img):
+    """
+    Compacte globale signature: HSV kleur histogram + dHash per rotatie + textuur.
+
+    Het histogram is rotatie-onafhankelijk; de hash wordt voor alle 4 rotaties
+    berekend zodat een gedraaide foto dezelfde hash kan opleveren. De textuur
+    (variantie van de Laplacian op 256 px) is laag voor egale en wazige foto's,
+    waar de dHash naar ~0 zakt en dus niets meer zegt.
+    """
+    texture_gray = cv2.cvtColor(resize_max(img, 256), cv2.COLOR_BGR2GRAY)
+    texture = float(cv2.Laplacian(texture_gray, cv2.CV_64F).var())
+
+    small = cv2.resize(img, (64, 64), interpolation=cv2.INTER_AREA)
+
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, [16, 8], [0, 180, 0, 256])
+    hist = cv2.normalize(hist, hist).flatten()
+
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    hashes = [dhash(rotate_image(gray, angle)) for angle in [0, 90, 180, 270]]
+
+    return {"hist": hist, "hashes": hashes, "texture": texture}
+
+# Cache van de referentie signature, ongeldig als orgineel.JPG wijzigt
+_reference_signature = None
+_reference_signature_mtime = None
+
+def get_reference_signature():
+    """Retourneer de (gecachte) signature van de referentie foto."""
+    global _reference_signature, _reference_signature_mtime
+
+    mtime = REFERENCE_IMAGE.stat().st_mtime
+    if _reference_signature is None or _reference_signature_mtime != mtime:
+        img_ref = cv2.imread(str(REFERENCE_IMAGE), cv2.IMREAD_REDUCED_COLOR_4)
+        if img_ref is None:
+            return None
+        _reference_signature = compute_signature(img_ref)
+        _reference_signature_mtime = mtime
+
+    return _reference_signature
+
+def prefilter_decision(hist_correl: float, hash_distance: int, texture: float = None) -> bool:
+    """
+    True als de upload zeker geen match is: te weinig textuur (egaal/wazig),
+    een histogram ver onder de grens zonder dat de hash dichtbij is, of
+    histogram én hash die allebei afwijken.
+    """
+    if texture is not None and texture < PREFILTER_MIN_TEXTURE:
+        return True
+    if hist_correl < PREFILTER_HARD_MIN_HIST_CORREL and hash_distance > PREFILTER_MAX_HASH_DISTANCE // 2:
+        return True
+    return hist_correl < PREFILTER_MIN_HIST_CORREL and hash_distance > PREFILTER_MAX_HASH_DISTANCE
+
+def prefilter_image(image_path: Path):
+    """
+    Vergelijk de globale signature van de upload met die van de referentie.
+    Retourneert dict met scores en "reject", of None als de prefilter niet kan draaien.
+    """
+    start = time.perf_counter()
+
+    ref_signature = get_reference_signature()
+    # Gereduceerde JPEG decode (1/4 resolutie) is veel sneller dan een volledige decode
+    img_test = cv2.imread(str(image_path), cv2.IMREAD_REDUCED_COLOR_4)
+
+    if ref_signature is None or img_test is None:
+        return None
+
+    test_signature = compute_signature(img_test)
+
+    hist_correl = float(cv2.compareHist(ref_signature["hist"], test_signature["hist"], cv2.HISTCMP_CORREL))
+    # Upload hash (0°) tegen alle gedraaide referentie hashes
+    test_hash = test_signature["hashes"][0]
+    hash_distance = min(bin(test_hash ^ ref_hash).count("1") for ref_hash in ref_signature["hashes"])
+
+    return {
+        "hist_correl": round(hist_correl, 4),
+        "hash_distance": hash_distance,
+        "texture": round(test_signature["texture"], 2),
+        "reject": prefilter_decision(hist_correl, hash_distance, test_signature["texture"]),
+        "ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+
+def prefilter_stats() -> dict:
+    """
+    Meet de prefilter tegen de opgeslagen score historie.
+
+    Alleen uploads waarvoor de volledige SIFT vergelijking gedraaid heeft
+    (doorgelaten of shadow run) tellen mee. Een false-reject is een SIFT match
+    die met de huidige thresholds door de prefilter afgewezen zou worden.
+    Shadow runs worden gewogen met 1 / de kans waarmee ze toen gesampled zijn.
+    Zonder shadow runs is de rate niet meetbaar en is false_reject_rate None.
+    """
+    with _upload_index_lock:
+        entries = [e for e in _upload_index.values() if "prefilter" in e]
+
+    def weight(entry):
+        if entry["prefilter"]["reject"]:
+            return 1.0 / entry["prefilter"]["shadow_rate"]
+        return 1.0
+
+    def rejected_now(entry):
+        pf = entry["prefilter"]
+        return prefilter_decision(pf["hist_correl"], pf["hash_distance"], pf.get("texture"))
+
+    evaluated = [e for e in entries if "sift_match" in e]
+    # Afwijzingen van voor het bewaren van de sampling kans zijn niet te wegen
+    evaluated = [e for e in evaluated if not e["prefilter"]["reject"] or e["prefilter"].get("shadow_rate")]
+
+    recorded_rejects = [e for e in entries if e["prefilter"]["reject"]]
+    shadow_runs = [e for e in evaluated if e["prefilter"]["reject"]]
+    # Als afgewezen uploads nooit SIFT gedraaid hebben, weten we niets over hun matches
+    measurable = not recorded_rejects or bool(shadow_runs)
+
+    matches = [e for e in evaluated if e["sift_match"]]
+    false_rejects = [e for e in matches if rejected_now(e)]
+    rejected = [e for e in entries if rejected_now(e)]
+
+    weighted_matches = sum(weight(e) for e in matches)
+    weighted_false_rejects = sum(weight(e) for e in false_rejects)
+
+    if not measurable:
+        false_reject_rate = None
+    else:
+        false_reject_rate = weighted_false_rejects / weighted_matches if weighted_matches else 0.0
+
+    return {
+        "uploads": len(entries),
+        "rejected": len(rejected),
+        "reject_rate": len(rejected) / len(entries) if entries else 0.0,
+        "sift_evaluated": len(evaluated),
+        "shadow_runs": len(shadow_runs),
+        "sift_matches": len(matches),
+        "false_rejects": len(false_rejects),
+        "false_reject_rate_measurable": measurable,
+        "false_reject_rate": false_reject_rate,
+    }
+
 def compare_images(image_path1: Path, image_path2: Path) -> bool:
     """
     Robuuste puzzel verificatie met perspective correction en rotatie handling.
@@ -258,29 +721,18 @@ async def upload_photo(file: UploadFile = File(...)):
         if not file.content_type.startswith("image/"):
             raise HTTPException(status_code=400, detail="File must be an image")
 
-        # Genereer timestamp in formaat YYYYMMDD_HHMMSS
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-
         # Bepaal de bestandsextensie
         file_extension = Path(file.filename).suffix.lower()
         if not file_extension:
             file_extension = ".jpg"  # Standaard als geen extensie aanwezig
 
-        # Sla op met timestamp
-        timestamped_filename = f"upload_{timestamp}{file_extension}"
-        file_path = UPLOAD_DIR / timestamped_filename
-
         # Lees de file content
         content = await file.read()
 
-        # Sla op met timestamp
-        with open(file_path, "wb") as buffer:
-            buffer.write(content)
-
-        # Sla ook op als upload_latest voor de frontend
-        latest_path = UPLOAD_DIR / f"upload_latest{file_extension}"
-        with open(latest_path, "wb") as buffer:
-            buffer.write(content)
+        # Sla op in gesharde directory met uniek upload ID
+        entry = store_upload(content, file_extension)
+        timestamped_filename = entry["filename"]
+        file_path = UPLOAD_DIR / entry["path"]
 
         # Vergelijk de geüploade foto met orgineel.JPG
         is_match = False
@@ -293,15 +745,38 @@ async def upload_photo(file: UploadFile = File(...)):
             print(f"Reference: {REFERENCE_IMAGE}")
             print(f"{'='*60}")
 
-            is_match = compare_images(file_path, REFERENCE_IMAGE)
+            prefilter = prefilter_image(file_path) if PREFILTER_ENABLED else None
+            run_sift = True
+
+            if prefilter is not None:
+                print(f"   Prefilter: hist {prefilter['hist_correl']:.3f}, " +
+                      f"hash distance {prefilter['hash_distance']}, texture {prefilter['texture']:.1f} " +
+                      f"({prefilter['ms']:.1f} ms)")
+                if prefilter["reject"]:
+                    # Een deel van de afwijzingen draait toch SIFT om false-rejects te meten;
+                    # de gebruikte kans wordt bewaard zodat de historie correct gewogen blijft
+                    prefilter["shadow_rate"] = PREFILTER_SHADOW_RATE
+                    run_sift = random.random() < PREFILTER_SHADOW_RATE
+                    print(f"   Prefilter: ❌ definitely no match" +
+                          (" (shadow run: comparing anyway)" if run_sift else " - skipping SIFT"))
+
+            fields = {}
+            if prefilter is not None:
+                fields["prefilter"] = prefilter
+
+            if run_sift:
+                is_match = compare_images(file_path, REFERENCE_IMAGE)
+                fields["sift_match"] = bool(is_match)
 
             print(f"Match result: {'✅ MATCH' if is_match else '❌ NO MATCH'}")
             print(f"{'='*60}\n")
 
+            update_upload(entry["id"], match=bool(is_match), **fields)
+
             if is_match:
-                result_message = "Gefeliciteerd, je hebt de puzzel opgelost, de code is: 196"
+                result_message = MATCH_MESSAGE
             else:
-                result_message = "Helaas, de puzzel is nog niet goed opgelost, probeer het nogmaals en upload een nieuwe foto"
+                result_message = NO_MATCH_MESSAGE
         else:
             result_message = "Referentie afbeelding niet gevonden"
             print(f"⚠️  WARNING: Reference image not found at {REFERENCE_IMAGE}")
@@ -344,6 +819,19 @@ async def set_threshold(data: ThresholdUpdate):
         "message": f"Threshold updated to {MATCH_THRESHOLD:.1%}"
     })
 
+@app.get("/api/admin/prefilter")
+async def get_prefilter_stats():
+    """Prefilter configuratie en gemeten false-reject rate"""
+    return JSONResponse(content={
+        "enabled": PREFILTER_ENABLED,
+        "min_hist_correl": PREFILTER_MIN_HIST_CORREL,
+        "max_hash_distance": PREFILTER_MAX_HASH_DISTANCE,
+        "hard_min_hist_correl": PREFILTER_HARD_MIN_HIST_CORREL,
+        "min_texture": PREFILTER_MIN_TEXTURE,
+        "shadow_rate": PREFILTER_SHADOW_RATE,
+        "stats": prefilter_stats()
+    })
+
 @app.get("/status")
 async def health_check():
     """Health check endpoint voor monitoring en load balancers"""
@@ -356,6 +844,10 @@ async def health_check():
     # Get system info
     memory = psutil.virtual_memory()
 
+    # Snapshot onder lock; de retentie job wijzigt de index vanuit een worker thread
+    with _upload_index_lock:
+        upload_entries = list(_upload_index.values())
+
     return JSONResponse(content={
         "status": "healthy",
         "service": "photo-match",
@@ -373,65 +865,394 @@ async def health_check():
             "memory_available_mb": round(memory.available / 1024 / 1024, 1),
             "memory_percent": memory.percent
         },
-        "uploads_directory": str(UPLOAD_DIR)
+        "uploads_directory": str(UPLOAD_DIR),
+        "uploads": {
+            "hot": sum(1 for e in upload_entries if "path" in e),
+            "archived": sum(1 for e in upload_entries if "archive" in e),
+            "retention_days": UPLOAD_RETENTION_DAYS,
+            "retention_policy": UPLOAD_RETENTION_POLICY
+        }
     })
 
 @app.get("/api/photo")
 async def get_photo():
-    """Haal de laatst geüploade foto op uit uploads folder (upload_latest.jpg)"""
+    """Haal de laatst geüploade foto op via de upload index"""
     # Zorg ervoor dat de uploads directory bestaat
     UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
-    # Zoek naar upload_latest met verschillende extensies
+    entry = latest_upload()
+    if entry is not None:
+        if "path" in entry:
+            return FileResponse(UPLOAD_DIR / entry["path"], headers=NO_CACHE_HEADERS)
+
+        # Gearchiveerd: lees via offset uit het tar segment
+        media_type = mimetypes.guess_type(entry["filename"])[0] or "application/octet-stream"
+        return Response(content=read_upload(entry), media_type=media_type, headers=NO_CACHE_HEADERS)
+
+    # Fallback voor oude (platte) uploads van voor de index
     image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp']
 
     for ext in image_extensions:
         latest_file = UPLOAD_DIR / f"upload_latest{ext}"
         if latest_file.exists():
-            return FileResponse(
-                latest_file,
-                headers={
-                    "Cache-Control": "no-cache, no-store, must-revalidate",
-                    "Pragma": "no-cache",
-                    "Expires": "0"
-                }
-            )
+            return FileResponse(latest_file, headers=NO_CACHE_HEADERS)
 
-    # Fallback: zoek naar de meest recente upload_* file
-    upload_files = [
-        f for f in UPLOAD_DIR.iterdir()
-        if f.is_file() and f.name.startswith("upload_")
-    ]
+    raise HTTPException(status_code=404, detail="No photos found")
+
+# CLAHE object per worker thread (OpenCV algoritme objecten zijn niet thread-safe)
+_live_clahe = threading.local()
+
+def live_preprocess(img, max_size):
+    """
+    Goedkope variant van preprocess_image voor live frames: eerst grayscale,
+    dan CLAHE direct op het grijze beeld (geen LAB conversie heen en terug).
+    """
+    clahe = getattr(_live_clahe, "clahe", None)
+    if clahe is None:
+        clahe = _live_clahe.clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+    gray = cv2.cvtColor(resize_max(img, max_size), cv2.COLOR_BGR2GRAY)
+    return clahe.apply(gray)
+
+# Cache van de SIFT features van de referentie voor live matching
+_live_reference = None
+_live_reference_mtime = None
+
+def get_live_reference():
+    """Retourneer (gecachte) SIFT keypoints en descriptors van de referentie foto."""
+    global _live_reference, _live_reference_mtime
+
+    mtime = REFERENCE_IMAGE.stat().st_mtime
+    if _live_reference is None or _live_reference_mtime != mtime:
+        img_ref = cv2.imread(str(REFERENCE_IMAGE))
+        if img_ref is None:
+            return None
+        # Zelfde preprocessing als de live frames, zodat de features consistent zijn
+        gray = live_preprocess(img_ref, 640)
+        sift = cv2.SIFT_create(nfeatures=1000)
+        kp, des = sift.detectAndCompute(gray, None)
+        if des is None:
+            return None
+        _live_reference = {"points": np.float32([k.pt for k in kp]), "descriptors": des}
+        _live_reference_mtime = mtime
+
+    return _live_reference
+
+class LiveMatchTracker:
+    """
+    Per-verbinding state voor live matching.
+
+    Keyframes draaien SIFT + RANSAC tegen de gecachte referentie. Tussen keyframes
+    worden de inlier punten met Lucas-Kanade optical flow gevolgd en wordt de
+    homography opnieuw geschat uit de gevolgde punten. De confidence is de inlier
+    ratio van de keyframe, geschaald met het deel van de inliers dat nog gevolgd wordt.
+    """
+
+    def __init__(self):
+        self.prev_gray = None
+        self.frame_pts = None  # Gevolgde punten in frame coördinaten
+        self.ref_pts = None  # Bijbehorende punten in de referentie
+        self.keyframe_inliers = 0
+        self.keyframe_confidence = 0.0
+        self.frames_since_keyframe = 0
+
+    def _reset(self):
+        self.frame_pts = None
+        self.ref_pts = None
+        self.keyframe_inliers = 0
+        self.keyframe_confidence = 0.0
+
+    def _keyframe(self, gray):
+        """Volledige SIFT match van het frame tegen de referentie."""
+        self.frames_since_keyframe = 0
+        self._reset()
+
+        reference = get_live_reference()
+        if reference is None:
+            return 0, 0
+
+        sift = cv2.SIFT_create(nfeatures=500)
+        kp, des = sift.detectAndCompute(gray, None)
+        if des is None or len(kp) < 10:
+            return 0, 0
+
+        flann = cv2.FlannBasedMatcher(dict(algorithm=1, trees=5), dict(checks=50))
+        matches = flann.knnMatch(des, reference["descriptors"], k=2)
+        good = [m[0] for m in matches if len(m) == 2 and m[0].distance < 0.7 * m[1].distance]
+        if len(good) < 10:
+            return 0, len(good)
+
+        frame_pts = np.float32([kp[m.queryIdx].pt for m in good]).reshape(-1, 1, 2)
+        ref_pts = reference["points"][[m.trainIdx for m in good]].reshape(-1, 1, 2)
+
+        M, mask = cv2.findHomography(frame_pts, ref_pts, cv2.RANSAC, 5.0)
+        if M is None:
+            return 0, len(good)
+
+        inliers = mask.ravel() == 1
+        if inliers.sum() < LIVE_MIN_TRACKED_POINTS:
+            # Te weinig inliers om te volgen: geen lock, terug naar het retry pad
+            return int(inliers.sum()), len(good)
+
+        self.frame_pts = frame_pts[inliers]
+        self.ref_pts = ref_pts[inliers]
+        self.keyframe_inliers = int(inliers.sum())
+        self.keyframe_confidence = self.keyframe_inliers / len(good)
+
+        return self.keyframe_inliers, len(good)
+
+    def _track(self, gray):
+        """Volg de inlier punten met optical flow; retourneert False bij verlies van lock."""
+        next_pts, status, _ = cv2.calcOpticalFlowPyrLK(
+            self.prev_gray, gray, self.frame_pts, None, winSize=(21, 21), maxLevel=3
+        )
+        if next_pts is None:
+            return False
+
+        tracked = status.ravel() == 1
+        next_pts = next_pts[tracked]
+        ref_pts = self.ref_pts[tracked]
+        if len(next_pts) < LIVE_MIN_TRACKED_POINTS:
+            return False
+
+        M, mask = cv2.findHomography(next_pts, ref_pts, cv2.RANSAC, 5.0)
+        if M is None:
+            return False
+
+        inliers = mask.ravel() == 1
+        if inliers.sum() < LIVE_MIN_TRACKED_POINTS:
+            return False
+
+        self.frame_pts = next_pts[inliers]
+        self.ref_pts = ref_pts[inliers]
+        return True
+
+    def process_frame(self, frame_bytes: bytes) -> dict:
+        """Verwerk één camera frame (JPEG/PNG bytes) en retourneer de live status."""
+        start = time.perf_counter()
+        self.frames_since_keyframe += 1
+
+        if (self.frame_pts is None and self.prev_gray is not None
+                and self.frames_since_keyframe < LIVE_RETRY_INTERVAL):
+            # Geen lock: frame niet eens decoderen tot de volgende retry keyframe
+            return {
+                "mode": "searching",
+                "confidence": 0.0,
+                "match": False,
+                "points": 0,
+                "ms": round((time.perf_counter() - start) * 1000, 2),
+            }
+
+        frame = None
+        if frame_bytes:
+            frame = cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            return {"mode": "error", "detail": "Could not decode frame"}
+
+        gray = live_preprocess(frame, LIVE_FRAME_MAX_SIZE)
+
+        if self.frame_pts is not None:
+            if (self.frames_since_keyframe < LIVE_KEYFRAME_INTERVAL and self.prev_gray is not None
+                    and self.prev_gray.shape == gray.shape and self._track(gray)):
+                mode = "tracking"
+            else:
+                self._keyframe(gray)
+                mode = "keyframe"
+        else:
+            self._keyframe(gray)
+            mode = "keyframe"
+
+        self.prev_gray = gray
 
-    if not upload_files:
-        raise HTTPException(status_code=404, detail="No photos found")
+        points = 0 if self.frame_pts is None else len(self.frame_pts)
+        if points:
+            survival = min(1.0, points / self.keyframe_inliers)
+            confidence = self.keyframe_confidence * survival
+        else:
+            confidence = 0.0
 
-    # Sorteer op modification time en pak de meest recente
-    latest_file = max(upload_files, key=lambda f: f.stat().st_mtime)
+        # Alleen een keyframe kan een match opleveren; tracking kan de confidence alleen laten dalen.
+        # Een hoge ratio uit een handvol punten telt niet als match.
+        is_match = confidence >= MATCH_THRESHOLD and points >= LIVE_MIN_TRACKED_POINTS
 
-    return FileResponse(
-        latest_file,
-        headers={
-            "Cache-Control": "no-cache, no-store, must-revalidate",
-            "Pragma": "no-cache",
-            "Expires": "0"
+        result = {
+            "mode": mode,
+            "confidence": round(confidence, 4),
+            "match": bool(is_match),
+            "points": points,
+            "ms": round((time.perf_counter() - start) * 1000, 2),
         }
-    )
+        if is_match:
+            result["result"] = MATCH_MESSAGE
+        return result
+
+@app.websocket("/api/live")
+async def live_match(websocket: WebSocket):
+    """
+    Live matching via WebSocket.
+
+    De client stuurt camera frames als binaire JPEG berichten en krijgt per frame
+    een JSON bericht terug met mode, confidence en match. Stuur het volgende frame
+    pas na het antwoord, dan wordt er nooit een achterstand opgebouwd.
+    """
+    await websocket.accept()
 
-# Serveer static files (JS, CSS, etc.)
-app.mount("/static", StaticFiles(directory="build/static"), name="static")
+    if not REFERENCE_IMAGE.exists():
+        await websocket.send_json({"mode": "error", "detail": "Referentie afbeelding niet gevonden"})
+        await websocket.close()
+        return
+
+    tracker = LiveMatchTracker()
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+
+            frame_bytes = message.get("bytes")
+            if frame_bytes is None:
+                # Alleen binaire frames worden ondersteund (1003: unsupported data)
+                await websocket.send_json({"mode": "error", "detail": "Expected binary image frames"})
+                await websocket.close(code=1003)
+                break
+
+            # OpenCV werk buiten de event loop zodat andere spelers niet wachten
+            result = await asyncio.to_thread(tracker.process_frame, frame_bytes)
+            await websocket.send_json(result)
+    except WebSocketDisconnect:
+        pass
+
+# In-memory index van build/ (relatief pad -> asset dict), gevuld bij startup
+_static_assets = {}
+
+def _load_static_asset(file_path: Path) -> dict:
+    """
+    Bouw de index entry voor één build bestand.
+
+    Kleine bestanden worden in memory gehouden, inclusief gzip/brotli varianten.
+    Voor grote bestanden worden alleen precompressed .br/.gz bestanden naast het
+    origineel gebruikt (als de build die aanlevert).
+    """
+    content = file_path.read_bytes()
+    media_type = mimetypes.guess_type(file_path.name)[0] or "application/octet-stream"
+    etag = hashlib.sha256(content).hexdigest()[:16]
+
+    if HASHED_FILENAME.search(file_path.name):
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "no-cache"
+
+    asset = {
+        "path": file_path,
+        "media_type": media_type,
+        "etag": etag,
+        "cache_control": cache_control,
+        "body": None,
+        "variants": {},
+    }
+
+    if len(content) <= STATIC_MEMORY_MAX_BYTES:
+        asset["body"] = content
+        if media_type.startswith(COMPRESSIBLE_TYPES):
+            variants = {"gzip": gzip.compress(content, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                variants["br"] = brotli.compress(content, quality=11)
+            # Alleen bewaren als de variant daadwerkelijk kleiner is
+            asset["variants"] = {enc: body for enc, body in variants.items() if len(body) < len(content)}
+    else:
+        for encoding, suffix in [("br", ".br"), ("gzip", ".gz")]:
+            precompressed = file_path.with_name(file_path.name + suffix)
+            if precompressed.is_file():
+                asset["variants"][encoding] = precompressed
+
+    return asset
+
+def load_static_assets():
+    """Indexeer de React build één keer, zodat requests geen filesystem calls doen."""
+    _static_assets.clear()
+    if not BUILD_DIR.is_dir():
+        print(f"⚠️  WARNING: React build not found at {BUILD_DIR}")
+        return
+
+    for file_path in BUILD_DIR.rglob("*"):
+        if not file_path.is_file():
+            continue
+        # Precompressed siblings horen bij het originele bestand
+        if file_path.suffix in (".br", ".gz") and file_path.with_suffix("").is_file():
+            continue
+        _static_assets[file_path.relative_to(BUILD_DIR).as_posix()] = _load_static_asset(file_path)
+
+    total_bytes = sum(len(a["body"]) for a in _static_assets.values() if a["body"] is not None)
+    print(f"📦 Indexed {len(_static_assets)} static assets ({total_bytes / 1024:.0f} KB in memory)")
+
+def _accepted_encodings(accept_encoding: str) -> set:
+    """Parse de Accept-Encoding header (encodings met q=0 tellen niet mee)."""
+    encodings = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        q = 1.0
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name and q > 0:
+            encodings.add(name.strip().lower())
+    return encodings
+
+def serve_static_asset(asset: dict, request: Request):
+    """Serveer een geïndexeerd asset met ETag, cache headers en de beste encoding."""
+    accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+
+    encoding = None
+    for candidate in ["br", "gzip"]:
+        if candidate in asset["variants"] and candidate in accepted:
+            encoding = candidate
+            break
+
+    # Sterke ETag per representatie
+    etag = f'"{asset["etag"]}-{encoding}"' if encoding else f'"{asset["etag"]}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": asset["cache_control"],
+    }
+    if asset["variants"]:
+        headers["Vary"] = "Accept-Encoding"
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match == "*" or etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        body = asset["variants"][encoding]
+    else:
+        body = asset["body"] if asset["body"] is not None else asset["path"]
+
+    if isinstance(body, Path):
+        return FileResponse(body, media_type=asset["media_type"], headers=headers)
+    return Response(content=body, media_type=asset["media_type"], headers=headers)
+
+load_static_assets()
 
 # Catch-all route voor React Router (moet als laatste komen)
 @app.get("/{full_path:path}")
-async def serve_react_app(full_path: str):
+async def serve_react_app(full_path: str, request: Request):
     """Serveer de React app voor alle routes die niet door API endpoints worden afgehandeld"""
-    # Als het bestand bestaat, serveer het
-    file_path = Path("build") / full_path
-    if file_path.is_file():
-        return FileResponse(file_path)
+    # Onbekende API routes krijgen een echte 404 in plaats van index.html
+    if full_path == "api" or full_path.startswith("api/"):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    # Als het bestand in de build zit, serveer het (dict lookup, geen stat)
+    asset = _static_assets.get(full_path)
+    if asset is not None:
+        return serve_static_asset(asset, request)
 
     # Anders, serveer index.html (voor client-side routing)
-    return FileResponse("build/index.html")
+    index_asset = _static_assets.get("index.html")
+    if index_asset is None:
+        raise HTTPException(status_code=404, detail="React build not found")
+    return serve_static_asset(index_asset, request)
 
 if __name__ == "__main__":
     import uvicorn